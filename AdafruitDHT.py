@@ -24,18 +24,34 @@ else:
     sys.exit(1)
 
 #dhtDevice = adafruit_dht.sensor(board.pin)
-dhtDevice = adafruit_dht.DHT22(4)
+# Create the device once and reuse it for every retry - the constructor claims
+# the GPIO.
+dhtDevice = sensor(getattr(board, 'D' + pin))
 
 #sensor = adafruit_dht.DHT22
 #pin = 4
 
-# Try to grab a sensor reading.  Use the read_retry method which will retry up
-# to 15 times to get a sensor reading (waiting 2 seconds between each retry).
+# Try to grab a sensor reading.  Retry up to 5 times, waiting 2 seconds between
+# each retry (the DHT22 can't be read more often than that).
+DHT_MIN_INTERVAL = 2
+DHT_RETRIES = 5
 
 #humidity, temperature = adafruit_dht.read_retry(sensor, pin)
 
-humidity = dhtDevice.humidity
-temperature = dhtDevice.temperature
+humidity = temperature = None
+for attempt in range(DHT_RETRIES):
+    if attempt:
+        time.sleep(DHT_MIN_INTERVAL)
+    try:
+        temperature = dhtDevice.temperature
+        humidity = dhtDevice.humidity
+        if humidity is not None and temperature is not None:
+            break
+    except RuntimeError:
+        # Checksum or timing errors are common, just read again
+        pass
+
+dhtDevice.exit()
 
 # Un-comment the line below to convert the temperature to Fahrenheit.
 # temperature = temperature * 9/5.0 + 32
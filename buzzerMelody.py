@@ -3,21 +3,20 @@
 from PiicoDev_Buzzer import PiicoDev_Buzzer
 from PiicoDev_Unified import sleep_ms
 
-# Define some note-frequency pairs
-octave = 2
-notes = {'C'  : octave * 262,
-         'Db' : octave * 277,
-         'D'  : octave * 294,
-         'Eb' : octave * 311,
-         'E'  : octave * 330,
-         'F'  : octave * 349,
-         'Gb' : octave * 370,
-         'G'  : octave * 392,
-         'Ab' : octave * 415,
-         'A'  : octave * 440,
-         'Bb' : octave * 466,
-         'B'  : octave * 494,
-         'Chi': octave * 523,
+# Define some note-frequency pairs (second octave: 2x the base frequencies)
+notes = {'C'  : 524,
+         'Db' : 554,
+         'D'  : 588,
+         'Eb' : 622,
+         'E'  : 660,
+         'F'  : 698,
+         'Gb' : 740,
+         'G'  : 784,
+         'Ab' : 830,
+         'A'  : 880,
+         'Bb' : 932,
+         'B'  : 988,
+         'Chi': 1046,
          'rest':0, # zero Hertz is the same as no tone at all
          }
 
@@ -42,13 +41,14 @@ melody = [['E',    500],
           ['rest', 500],
           ]
 
+# resolve the note names once - a flat tuple of (frequency, duration) pairs
+MELODY = tuple((notes[note], duration) for note, duration in melody)
+
 buzz = PiicoDev_Buzzer(volume=2)
 
 buzz.pwrLED(False)
 
 # play the melody
-for x in melody:
-    note = x[0] # extract the note name
-    duration = x[1] # extract the duration
-    buzz.tone(notes[note], duration)
-    sleep_ms(duration)
\ No newline at end of file
+for freq, duration in MELODY:
+    buzz.tone(freq, duration)
+    sleep_ms(duration)
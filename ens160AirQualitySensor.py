@@ -1,63 +1,157 @@
 # Read air quality metrics from the PiicoDev Air Quality Sensor ENS160
 # Shows three metrics: AQI, TVOC and eCO2
 
+import os
+import sys
 import math
+import time
+import random
+import signal
+import struct
+import asyncio
 import logging
+from collections import deque
 from PiicoDev_SSD1306 import *  # import the OLED device driver
 from PiicoDev_ENS160 import PiicoDev_ENS160  # import the device driver
 from PiicoDev_BME280 import (
     PiicoDev_BME280,
 )  # import the atmospheric sensor device driver
 from PiicoDev_TMP117 import PiicoDev_TMP117  # import TMP117 device driver
-from PiicoDev_Unified import sleep_ms  # a cross-platform sleep function
 
-import influxdb_client
-from influxdb_client import InfluxDBClient, Point, WritePrecision
-from influxdb_client.client.write_api import SYNCHRONOUS
+# Pass --no-influx to only show readings, without loading the InfluxDB client
+USE_INFLUX = "--no-influx" not in sys.argv
+if USE_INFLUX:
+    import aiohttp
+    from influxdb_client.rest import ApiException
+    from influxdb_client.client.influxdb_client_async import InfluxDBClientAsync
 
-# Configure logging
+# Configure logging; readings are logged at DEBUG, set LOG_LEVEL=DEBUG to see them
 logging.basicConfig(
-    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+    level=os.environ.get("LOG_LEVEL", "WARNING").upper(),
+    format="%(asctime)s - %(levelname)s - %(message)s",
 )
+log = logging.getLogger(__name__)
 
-token = os.environ.get("INFLUXDB_TOKEN")
 org = "raider"
 url = "http://192.168.1.10:8086"
 bucket = "sensorData"
 
-# Initialize InfluxDB Client
-write_client = InfluxDBClient(url=url, token=token, org=org)
-write_api = write_client.write_api(write_options=SYNCHRONOUS)
+SAMPLE_INTERVAL = 1  # seconds between sensor readings
+DISPLAY_INTERVAL = 1  # minimum seconds between OLED redraws
+# PiicoDev's SSD1306 driver only prints I2C errors, so a lost page write goes
+# unnoticed; the whole frame is resent this often to repair it
+DISPLAY_FULL_REFRESH = 30  # seconds
+
+# Failures each layer is expected to recover from. I2C errors surface as
+# OSError, or as ValueError when a driver returns NaN after a failed read.
+SENSOR_ERRORS = (OSError, ValueError)
+if USE_INFLUX:
+    INFLUX_ERRORS = (aiohttp.ClientError, asyncio.TimeoutError)
+
+# I2C Fast-mode; every device on the bus supports it. On a Raspberry Pi the
+# bus speed is fixed by the kernel, so also set dtparam=i2c_arm_baudrate=400000
+# in /boot/config.txt and reboot.
+I2C_FREQ = 400_000
+
+# Batch InfluxDB writes: queued points are posted in one request once
+# BATCH_SIZE have accumulated or FLUSH_INTERVAL has passed
+BATCH_SIZE = 60
+FLUSH_INTERVAL = 60  # seconds
+JITTER_INTERVAL = 2  # seconds, random delay added to each flush
+RETRY_INTERVAL = 5  # seconds before the first retry of a failed batch
+MAX_RETRY_DELAY = 30  # seconds; the retry delay doubles up to this after each failure
+PUBLISH_QUEUE_SIZE = 120  # readings waiting for the publish task; oldest dropped
+REPLAY_BUFFER_BYTES = 512 * 1024  # unsent line protocol kept while InfluxDB is down
+
+
+# Create the InfluxDB client once the program starts rather than at import,
+# so the token is only needed when publishing. Line protocol compresses well.
+def make_influx_client():
+    return InfluxDBClientAsync(
+        url=url,
+        token=os.environ["INFLUXDB_TOKEN"],
+        org=org,
+        enable_gzip=True,
+        timeout=5_000,  # ms
+        # Batches are posted one at a time, so a small pool keeps a single
+        # keep-alive connection warm instead of reconnecting per flush
+        connection_pool_maxsize=2,
+    )
 
 
 # Initialize sensors and display
 def init_devices():
-    temp_sensor = PiicoDev_TMP117()  # initialise the precision temperature sensor
-    air_quality_sensor = PiicoDev_ENS160()  # Initialise the ENS160 air quality sensor
-    atmospheric_sensor = PiicoDev_BME280()  # initialise the atmospheric sensor
-    display = create_PiicoDev_SSD1306()  # initialise the OLED display driver
+    temp_sensor = PiicoDev_TMP117(freq=I2C_FREQ)  # initialise the precision temperature sensor
+    air_quality_sensor = PiicoDev_ENS160(freq=I2C_FREQ)  # Initialise the ENS160 air quality sensor
+    atmospheric_sensor = PiicoDev_BME280(freq=I2C_FREQ)  # initialise the atmospheric sensor
+    display = create_PiicoDev_SSD1306(freq=I2C_FREQ)  # initialise the OLED display driver
+    render_background(display)
     return temp_sensor, air_quality_sensor, atmospheric_sensor, display
 
 
-def write_to_influx(temperature, humidity, pres_hPa, aqi, aqiRating, tvoc, eco2, eco2Rating, sensorStatus):
+# Line protocol for one reading; the measurement and tags never change.
+# aqi, tvoc and eco2 carry the "i" suffix to keep them integer fields.
+_LINE_PREFIX = "sensorReading,sensor=PiicoDevSensors,location=bedroom3 "
+# String field values must have quotes and backslashes escaped
+_FIELD_ESCAPE = str.maketrans({'"': '\\"', "\\": "\\\\"})
+
+
+def build_line(temperature, humidity, pres_hPa, aqi, aqiRating, tvoc, eco2, eco2Rating, sensorStatus, timestamp):
+    return (
+        f"{_LINE_PREFIX}temperature={temperature},humidity={humidity},pressure={pres_hPa},"
+        f"aqi={aqi}i,tvoc={tvoc}i,eco2={eco2}i,"
+        f'aqi_rating="{aqiRating}",eco2_rating="{eco2Rating}",'
+        f'sensor_status="{sensorStatus.translate(_FIELD_ESCAPE)}"'
+        f" {timestamp}"
+    )
+
+
+def reading_line(sensor_data):
+    return build_line(
+        sensor_data["tempC"],
+        sensor_data["humRH"],
+        sensor_data["pres_hPa"],
+        sensor_data["aqi"],
+        sensor_data["aqi_rating"],
+        sensor_data["tvoc"],
+        sensor_data["eco2"],
+        sensor_data["eco2_rating"],
+        sensor_data["sensor_status"],
+        sensor_data["timestamp"],
+    )
+
+
+# Reading quantized to the precision worth storing
+# (0.1 °C, 1 %RH, 1 hPa, 10 ppb TVOC, 5 ppm eCO2)
+def publish_key(sensor_data):
+    return (
+        round(sensor_data["tempC"], 1),
+        round(sensor_data["humRH"]),
+        round(sensor_data["pres_hPa"]),
+        sensor_data["aqi"],
+        sensor_data["tvoc"] // 10,
+        sensor_data["eco2"] // 5,
+        sensor_data["aqi_rating"],
+        sensor_data["eco2_rating"],
+        sensor_data["sensor_status"],
+    )
+
+
+# Returns False if the batch should be retried. Network errors, 429 and 5xx
+# are transient; any other status (bad line, auth, missing bucket, points
+# beyond retention) would fail the same way again, so the batch is dropped.
+async def write_to_influx(write_api, lines):
     try:
-        point = (
-            Point("sensorReading")
-            .tag("sensor", "PiicoDevSensors")
-            .tag("location", "bedroom3")
-            .field("temperature", temperature)
-            .field("humidity", humidity)
-            .field("pressure", pres_hPa)
-            .field("aqi", aqi)
-            .field("tvoc", tvoc)
-            .field("eco2", eco2)
-            .field("aqi_rating", aqiRating)
-            .field("eco2_rating", eco2Rating)
-            .field("sensor_status", sensorStatus)
-        )
-        write_api.write(bucket=bucket, org=org, record=point)
-    except Exception as e:
-        logging.error("Error writing to InfluxDB: %s", e)
+        return await write_api.write(bucket=bucket, org=org, record=lines)
+    except ApiException as e:
+        if e.status is not None and e.status != 429 and e.status < 500:
+            log.error("InfluxDB rejected %d lines, dropping them: %s", len(lines), e)
+            return True
+        log.error("Error writing to InfluxDB: %s", e)
+        return False
+    except INFLUX_ERRORS as e:
+        log.error("Error writing to InfluxDB: %s", e)
+        return False
 
 
 # Air Quality signal characteristics
@@ -65,6 +159,47 @@ def write_to_influx(temperature, humidity, pres_hPa, aqi, aqiRating, tvoc, eco2,
 # eCO2: 400 - 65,000 ppm CO2 equiv.
 # AQI-UBA: 1 to 5
 
+# ENS160 registers: TEMP_IN/RH_IN (0x13-0x16) and DATA_AQI/TVOC/ECO2 (0x21-0x25)
+# are contiguous, so each block is covered by a single I2C transaction
+_ENS160_REG_TEMP_IN = 0x13
+_ENS160_REG_DATA_AQI = 0x21
+_ENS160_DATA = struct.Struct("<BHH")  # DATA_AQI, DATA_TVOC, DATA_ECO2
+_AQI_RATINGS = {1: "excellent", 2: "good", 3: "moderate", 4: "poor", 5: "unhealthy"}
+
+
+def rate_eco2(eco2):
+    if eco2 < 400:
+        return "invalid"
+    if eco2 < 600:
+        return "excellent"
+    if eco2 < 800:
+        return "good"
+    if eco2 < 1000:
+        return "fair"
+    if eco2 < 1500:
+        return "poor"
+    return "bad"
+
+
+# Write the temperature and humidity compensation values in one transaction
+def set_compensation(air_quality_sensor, tempC, humRH):
+    temp_in = int((tempC + 273.15) * 64)  # Kelvin * 64
+    rh_in = int(humRH * 512)  # %RH * 512
+    payload = temp_in.to_bytes(2, "little") + rh_in.to_bytes(2, "little")
+    air_quality_sensor.i2c.writeto_mem(
+        air_quality_sensor.address, _ENS160_REG_TEMP_IN, payload
+    )
+
+
+# Burst-read AQI, TVOC and eCO2 instead of one transaction per property
+def read_all(air_quality_sensor):
+    raw = air_quality_sensor.i2c.readfrom_mem(
+        air_quality_sensor.address, _ENS160_REG_DATA_AQI, _ENS160_DATA.size
+    )
+    # PiicoDev_Unified's Linux readfrom_mem returns a list of ints
+    aqi, tvoc, eco2 = _ENS160_DATA.unpack(bytes(raw))
+    return aqi & 0x07, tvoc, eco2
+
 
 # Read sensor data
 def read_sensors(temp_sensor, air_quality_sensor, atmospheric_sensor):
@@ -77,98 +212,176 @@ def read_sensors(temp_sensor, air_quality_sensor, atmospheric_sensor):
     # tempK = temp_sensor.readTempK()  # Kelvin
 
     # Set Air Quality Sensor temp and humidity params (ENS160)
-    air_quality_sensor.temperature = tempC_tempSensor
-    air_quality_sensor.humidity = humRH
+    set_compensation(air_quality_sensor, tempC_tempSensor, humRH)
 
-    aqi = air_quality_sensor.aqi
-    tvoc = air_quality_sensor.tvoc
-    eco2 = air_quality_sensor.eco2
+    aqi, tvoc, eco2 = read_all(air_quality_sensor)
 
     return {
         "tempC": tempC_tempSensor,
         "pres_hPa": pres_hPa,
         "humRH": humRH,
-        "aqi": aqi.value,
-        "aqi_rating": aqi.rating,
+        "aqi": aqi,
+        "aqi_rating": _AQI_RATINGS.get(aqi, "invalid"),
         "tvoc": tvoc,
-        "eco2": eco2.value,
-        "eco2_rating": eco2.rating,
+        "eco2": eco2,
+        "eco2_rating": rate_eco2(eco2),
         "sensor_status": air_quality_sensor.operation,
+        "timestamp": time.time_ns(),  # points are written later in batches
     }
 
 
+# Console and display layouts, formatted with the values of _CONSOLE_KEYS
+# and _DISPLAY_KEYS
+_DISPLAY_KEYS = (
+    "tempC",
+    "humRH",
+    "pres_hPa",
+    "aqi",
+    "aqi_rating",
+    "tvoc",
+    "eco2",
+    "eco2_rating",
+    "sensor_status",
+)
+_CONSOLE_KEYS = ("tempC", "pres_hPa", "humRH", "aqi", "tvoc", "eco2", "sensor_status")
+_CONSOLE_TMPL = (
+    "Temp: %s °C, Press: %s hPa, Humid: %s %%RH, "
+    "AQI: %s, TVOC: %s ppb, eCO2: %s ppm, Status: %s"
+)
+
+# The OLED labels are static, so they're drawn once into a background image
+# and only the values after them are rendered each tick (8 px per character)
+_DISPLAY_LABELS = ("Temp: ", "Humid: ", "Press: ", "AQI: ", "TVOC: ", "eCO2: ")
+_DISPLAY_TMPL = ("{0}C", "{1}%", "{2}hPa", "{3} [{4}]", "{5}ppb", "{6}ppm [{7}]")
+_DISPLAY_VALUE_X = tuple(len(label) * 8 for label in _DISPLAY_LABELS)
+
+_display_background = None  # framebuffer holding only the labels
+_last_frame = None  # (page, values) currently on the screen
+
+
+# SSD1306 addressing commands used to target a single 8-pixel page
+_SET_COL_ADDR = 0x21
+_SET_PAGE_ADDR = 0x22
+_PAGES = HEIGHT // 8
+
+_frame_shadow = None  # copy of the framebuffer last sent to the panel
+_next_full_refresh = 0  # time.monotonic() when the whole frame is resent
+
+
+# Send only the 128-byte pages of the framebuffer that changed since the last
+# refresh. Adjacent changed pages go out together in a single transaction.
+def show_changes(display):
+    global _frame_shadow, _next_full_refresh
+    frame = memoryview(display.buffer)
+    if _frame_shadow is None or time.monotonic() >= _next_full_refresh:
+        _frame_shadow = None  # until show() completes, assume nothing was sent
+        display.show()
+        _frame_shadow = bytearray(frame)
+        _next_full_refresh = time.monotonic() + DISPLAY_FULL_REFRESH
+        return
+
+    changed = [
+        frame[p * WIDTH : (p + 1) * WIDTH] != _frame_shadow[p * WIDTH : (p + 1) * WIDTH]
+        for p in range(_PAGES)
+    ]
+    page = 0
+    while page < _PAGES:
+        if not changed[page]:
+            page += 1
+            continue
+        first = page
+        while page + 1 < _PAGES and changed[page + 1]:
+            page += 1
+
+        start = first * WIDTH
+        end = (page + 1) * WIDTH
+        try:
+            for cmd in (_SET_PAGE_ADDR, first, page, _SET_COL_ADDR, 0, WIDTH - 1):
+                display.write_cmd(cmd)
+            display.write_data(bytes(frame[start:end]))
+        except Exception:
+            _frame_shadow = None  # panel state unknown; resend it all next time
+            raise
+        _frame_shadow[start:end] = frame[start:end]
+        page += 1
+
+
 # Update console
 def update_console(sensor_data):
-    print(
-        f"Temp: {sensor_data['tempC']} °C, Press: {sensor_data['pres_hPa']} hPa, Humid: {sensor_data['humRH']} %RH"
-    )
-    print(
-        f"AQI: {sensor_data['aqi']}, TVOC: {sensor_data['tvoc']} ppb, eCO2: {sensor_data['eco2']} ppm"
-    )
-    print(f"Sensor Status: {sensor_data['sensor_status']}")
-    print("--------------------------------")
+    log.debug(_CONSOLE_TMPL, *[sensor_data[k] for k in _CONSOLE_KEYS])
 
 
-def update_display(display, sensor_data, page=0):
-    display.fill(0)  # Clear the display
-
-    if page == 0:
-        # First page: Temperature, Humidity, Pressure
-        display.text(f"Temp: {sensor_data['tempC']}C", 0, 0, 1)
-        display.text(f"Humid: {sensor_data['humRH']}%", 0, 10, 1)
-        display.text(f"Press: {sensor_data['pres_hPa']}hPa", 0, 20, 1)
-        display.text(
-            f"AQI: {sensor_data['aqi']}" + " [" + str(sensor_data["aqi_rating"]) + "]",
-            0,
-            30,
-            1,
-        )
-        display.text(f"TVOC: {sensor_data['tvoc']}ppb", 0, 40, 1)
-        display.text(
-            f"eCO2: {sensor_data['eco2']}ppm"
-            + " ["
-            + str(sensor_data["eco2_rating"])
-            + "]",
-            0,
-            50,
-            1,
-        )
+# Render the static labels once and keep a copy of the framebuffer
+def render_background(display):
+    global _display_background
+    display.fill(0)
+    for i, label in enumerate(_DISPLAY_LABELS):
+        display.text(label, 0, i * 10, 1)
+    _display_background = bytes(display.buffer)
 
-    # elif page == 1:
-    # Third page: Other metrics or messages
-    # display.text(f"Sensor Status: {sensor_data['sensor_status']}", 0, 0, 1)
 
-    display.show()
+# First page: Temperature, Humidity, Pressure
+def draw_main(display, vals):
+    display.buffer[:] = _display_background  # labels only
+    for i, tmpl in enumerate(_DISPLAY_TMPL):
+        display.text(tmpl.format(*vals), _DISPLAY_VALUE_X[i], i * 10, 1)
 
 
-# Main program loop
-def main():
-    temp_sensor, air_quality_sensor, atmospheric_sensor, display = init_devices()
-    page = 0
+# Second page: Other metrics or messages
+# def draw_status(display, vals):
+#     display.fill(0)  # Clear the display
+#     display.text(f"Sensor Status: {vals[8]}", 0, 0, 1)
+
+
+# Renderers indexed by page number
+_PAGE_RENDERERS = (draw_main,)
+
+
+def update_display(display, sensor_data, page=0):
+    global _last_frame
+    vals = tuple([sensor_data[k] for k in _DISPLAY_KEYS])
+    if (page, vals) == _last_frame and time.monotonic() < _next_full_refresh:
+        return  # the screen already shows these values
+
+    _PAGE_RENDERERS[page](display, vals)
+    show_changes(display)
+    _last_frame = (page, vals)
+
+
+# Sample the sensors and hand each reading to the display and publish tasks
+async def sample_loop(
+    temp_sensor, air_quality_sensor, atmospheric_sensor, display_queue, publisher_queue=None
+):
+    loop = asyncio.get_running_loop()
+    next_sample = loop.time()
     while True:
         try:
-            sensor_data = read_sensors(
-                temp_sensor, air_quality_sensor, atmospheric_sensor
+            # The I2C reads block, so run them in a worker thread and keep the
+            # event loop free for the display and publish tasks
+            sensor_data = await asyncio.to_thread(
+                read_sensors, temp_sensor, air_quality_sensor, atmospheric_sensor
             )
-            update_console(sensor_data)
-            update_display(display, sensor_data, page)
-
-            write_to_influx(
-                sensor_data["tempC"],
-                sensor_data["humRH"],
-                sensor_data["pres_hPa"],
-                sensor_data["aqi"],
-                sensor_data["aqi_rating"],
-                sensor_data["tvoc"],
-                sensor_data["eco2"],
-                sensor_data["eco2_rating"],
-                sensor_data["sensor_status"],
-            )
-
-            # page = (page + 1) % 2  # Cycle through 2 pages
-            sleep_ms(1000)
-        except Exception as e:
-            print(f"Error: {e}")
+        except SENSOR_ERRORS as e:
+            log.error("Error reading sensors: %s", e)
+        else:
+            if log.isEnabledFor(logging.DEBUG):
+                update_console(sensor_data)
+
+            # Only the newest reading is worth drawing
+            if display_queue.full():
+                display_queue.get_nowait()
+            display_queue.put_nowait(sensor_data)
+            if publisher_queue is not None:
+                try:
+                    publisher_queue.put_nowait(sensor_data)
+                except asyncio.QueueFull:
+                    publisher_queue.get_nowait()  # drop the oldest reading
+                    publisher_queue.put_nowait(sensor_data)
+
+        # Keep a fixed cadence on the monotonic clock, so the time spent
+        # reading doesn't stretch the interval; skip ahead if we fell behind
+        next_sample = max(next_sample + SAMPLE_INTERVAL, loop.time())
+        await asyncio.sleep(next_sample - loop.time())
 
         """
         pres_hPa = presPa / 100  # convert Pascals to hPa (mbar)
@@ -201,5 +414,156 @@ def main():
         """
 
 
+# Redraw the OLED with the newest reading, at most once per DISPLAY_INTERVAL
+async def display_loop(display, display_queue):
+    loop = asyncio.get_running_loop()
+    page = 0
+    while True:
+        sensor_data = await display_queue.get()
+        drawn_at = loop.time()
+        try:
+            update_display(display, sensor_data, page)
+        except OSError as e:
+            log.error("Error updating display: %s", e)
+
+        # Readings that arrive meanwhile replace each other in the queue
+        await asyncio.sleep(drawn_at + DISPLAY_INTERVAL - loop.time())
+
+        # page = (page + 1) % len(_PAGE_RENDERERS)  # Cycle through the pages
+
+
+# Wait up to timeout seconds for the next queued reading, or return None.
+# Not asyncio.wait_for: before Python 3.12 it can swallow a cancellation that
+# races with the get completing, which would leave the publisher running.
+async def next_reading(publisher_queue, timeout):
+    get = asyncio.ensure_future(publisher_queue.get())
+    try:
+        done, _ = await asyncio.wait((get,), timeout=timeout)
+    except asyncio.CancelledError:
+        # A reading taken just before the cancel goes back on the queue so
+        # the shutdown flush still sees it (if the queue has refilled, it is
+        # the oldest and would have been dropped anyway)
+        if get.done() and not get.cancelled():
+            try:
+                publisher_queue.put_nowait(get.result())
+            except asyncio.QueueFull:
+                pass
+        raise
+    finally:
+        if not get.done():
+            get.cancel()
+    return get.result() if done else None
+
+
+# Write readings to InfluxDB in batches without holding up sensor polling
+async def publish_loop(write_api, publisher_queue):
+    loop = asyncio.get_running_loop()
+    batch = deque()  # unsent lines, oldest first
+    batch_bytes = 0
+    dropping = False  # set while the buffer is over budget, so we warn only once
+    last_key = None
+    retry_delay = 0  # non-zero while a failed batch is being retried
+    flush_at = loop.time() + FLUSH_INTERVAL + random.uniform(0, JITTER_INTERVAL)
+    try:
+        while True:
+            sensor_data = await next_reading(
+                publisher_queue, max(flush_at - loop.time(), 0)
+            )
+            if sensor_data is not None:
+                key = publish_key(sensor_data)
+                # Skip readings that haven't changed since the last one published
+                if key != last_key:
+                    last_key = key
+                    line = reading_line(sensor_data)
+                    batch.append(line)
+                    batch_bytes += len(line)
+
+                    # Evict the oldest lines once the buffer is over budget
+                    while batch_bytes > REPLAY_BUFFER_BYTES:
+                        batch_bytes -= len(batch.popleft())
+                        if not dropping:
+                            log.warning("InfluxDB backlog full, dropping oldest readings")
+                            dropping = True
+
+            full = len(batch) >= BATCH_SIZE and not retry_delay
+            if not full and loop.time() < flush_at:
+                continue
+            sent = list(batch)
+            if not sent or await write_to_influx(write_api, sent):
+                # Only remove what was sent (written, or rejected for good)
+                for _ in sent:
+                    batch_bytes -= len(batch.popleft())
+                dropping = False
+                retry_delay = 0
+                flush_at = (
+                    loop.time() + FLUSH_INTERVAL + random.uniform(0, JITTER_INTERVAL)
+                )
+            else:
+                retry_delay = min(retry_delay * 2 or RETRY_INTERVAL, MAX_RETRY_DELAY)
+                flush_at = loop.time() + retry_delay
+    finally:
+        # Flush whatever is still buffered or queued on shutdown
+        while not publisher_queue.empty():
+            batch.append(reading_line(publisher_queue.get_nowait()))
+        if batch:
+            await write_to_influx(write_api, list(batch))
+
+
+# Run the program's tasks until SIGINT/SIGTERM, then cancel them so the
+# publisher can flush its buffer and the InfluxDB client is closed
+async def run_tasks(*coros):
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    tasks = [asyncio.create_task(coro) for coro in coros]
+    stopper = asyncio.create_task(stop.wait())
+    done, _ = await asyncio.wait(
+        [stopper, *tasks], return_when=asyncio.FIRST_COMPLETED
+    )
+    for task in (stopper, *tasks):
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    for task in done:
+        if task is not stopper:
+            task.result()  # a task only finishes early if it crashed
+
+
+# Main program: sampling, display refresh and publishing run as independent tasks.
+# With publish=False readings only go to the console and OLED.
+async def main(publish=True):
+    if publish and not os.environ.get("INFLUXDB_TOKEN"):
+        sys.exit("INFLUXDB_TOKEN is not set")
+    temp_sensor, air_quality_sensor, atmospheric_sensor, display = init_devices()
+    display_queue = asyncio.Queue(maxsize=1)
+
+    if not publish:
+        await run_tasks(
+            sample_loop(
+                temp_sensor, air_quality_sensor, atmospheric_sensor, display_queue
+            ),
+            display_loop(display, display_queue),
+        )
+        return
+
+    publisher_queue = asyncio.Queue(maxsize=PUBLISH_QUEUE_SIZE)
+
+    # Initialize InfluxDB Client
+    async with make_influx_client() as write_client:
+        write_api = write_client.write_api()
+        await run_tasks(
+            sample_loop(
+                temp_sensor,
+                air_quality_sensor,
+                atmospheric_sensor,
+                display_queue,
+                publisher_queue,
+            ),
+            display_loop(display, display_queue),
+            publish_loop(write_api, publisher_queue),
+        )
+
+
 if __name__ == "__main__":
-    main()
+    asyncio.run(main(publish=USE_INFLUX))
@@ -1,79 +1,224 @@
 #!/usr/bin/python3
 
 import os
+import sys
 import time
-import Adafruit_DHT
+import signal
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import board
+import adafruit_dht
 import logging
-import influxdb_client
-from influxdb_client import InfluxDBClient, Point, WritePrecision
-from influxdb_client.client.write_api import SYNCHRONOUS
+
+# Pass --no-influx to log to the CSV only, without loading the InfluxDB client
+USE_INFLUX = "--no-influx" not in sys.argv
+if USE_INFLUX:
+    from influxdb_client import InfluxDBClient, WritePrecision
+    from influxdb_client.client.write_api import WriteOptions
 
 token = os.environ.get("INFLUXDB_TOKEN")
 org = "raider"
 url = "http://192.168.1.10:8086"
 bucket = "sensorData"
 
-print("Token: ", token)  # Remove this line after verification
-
-# Initialize InfluxDB Client
-write_client = InfluxDBClient(url=url, token=token, org=org)
-write_api = write_client.write_api(write_options=SYNCHRONOUS)
-
-# Configure logging
+if USE_INFLUX and not token:
+    sys.exit("INFLUXDB_TOKEN is not set")
+
+write_client = None
+write_api = None
+
+
+# Failed batches are reported from the client's background thread
+def on_write_error(conf, data, exception):
+    logging.error("Error writing to InfluxDB: %s", exception)
+
+
+# Initialize InfluxDB Client; points are buffered and sent in batches in the
+# background, so write() doesn't block the sampling loop
+def initialize_influx():
+    global write_client, write_api
+    write_client = InfluxDBClient(
+        url=url,
+        token=token,
+        org=org,
+        enable_gzip=True,
+        timeout=10_000,  # ms
+        # One client is reused for every batch, and the batches are posted one
+        # at a time, so a small pool keeps a single keep-alive connection warm
+        connection_pool_maxsize=2,
+    )
+    write_api = write_client.write_api(
+        write_options=WriteOptions(
+            batch_size=500,
+            flush_interval=5_000,
+            jitter_interval=1_000,
+            retry_interval=5_000,
+        ),
+        error_callback=on_write_error,
+    )
+
+
+# Configure logging; readings are logged at DEBUG, set LOG_LEVEL=DEBUG to see them
 logging.basicConfig(
-    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+    level=os.environ.get("LOG_LEVEL", "WARNING").upper(),
+    format="%(asctime)s - %(levelname)s - %(message)s",
 )
 
-DHT_SENSOR = Adafruit_DHT.DHT22
-DHT_PIN = 4
+DHT_PIN = board.D4
+DHT_RETRIES = 5
+DHT_MIN_INTERVAL = 2  # seconds; the DHT22 can't be read more often than that
 FILENAME = "/home/pi/humidity.csv"
+SAMPLE_INTERVAL = 15  # seconds between readings
+# Line protocol for one reading; the measurement and tags never change
+# (tags in key order)
+LINE_PREFIX = "sensorReading,location=bedroom3,sensor=DHT22 "
+CSV_FLUSH_ROWS = 40  # write rows to disk every 40 samples (~10 minutes)
+CSV_ROW = "{0},{1:0.1f},{2:0.1f}%\r\n"  # date and time come from one strftime
+
+dht_device = None
+dht_executor = None  # single thread that does every read of dht_device
+csv_file = None
+csv_rows = []  # formatted rows not yet written to csv_file
 
 
+# One DHT22 object serves every reading; it holds the pin until exit()
+def initialize_sensor():
+    global dht_device, dht_executor
+    dht_device = adafruit_dht.DHT22(DHT_PIN)
+    dht_executor = ThreadPoolExecutor(max_workers=1)
+
+
+# Open the CSV once and keep it open; rows are collected in csv_rows and
+# written out together every CSV_FLUSH_ROWS samples and on shutdown
 def initialize_file():
-    if not os.path.exists(FILENAME) or os.stat(FILENAME).st_size == 0:
-        with open(FILENAME, "w") as f:
-            f.write("Date,Time,Temperature,Humidity\r\n")
+    global csv_file
+    is_new = not os.path.exists(FILENAME) or os.stat(FILENAME).st_size == 0
+    csv_file = open(FILENAME, "a")
+    if is_new:
+        csv_file.write("Date,Time,Temperature,Humidity\r\n")
+
+
+# Rows are cleared even if the write fails (disk full, SD card error);
+# keeping them would write them twice on the next flush and grow without bound
+def flush_csv():
+    if not csv_rows:
+        return
+    try:
+        csv_file.writelines(csv_rows)
+        csv_file.flush()
+    except OSError as e:
+        logging.error(
+            "Error writing %s, dropped %d rows: %s", FILENAME, len(csv_rows), e
+        )
+    csv_rows.clear()
 
 
-def write_to_influx(temperature, humidity):
+# Readings are 15 s apart, so second precision is plenty and keeps the
+# timestamps short
+def write_to_influx(temperature, humidity, timestamp):
     try:
-        point = (
-            Point("sensorReading")
-            .tag("sensor", "DHT22")
-            .tag("location", "bedroom3")
-            .field("temperature", temperature)
-            .field("humidity", humidity)
+        line = f"{LINE_PREFIX}temperature={temperature},humidity={humidity} {timestamp}"
+        write_api.write(
+            bucket=bucket, org=org, record=line, write_precision=WritePrecision.S
         )
-        write_api.write(bucket=bucket, org=org, record=point)
     except Exception as e:
         logging.error("Error writing to InfluxDB: %s", e)
 
 
-def log_sensor_data():
+def read_dht():
     try:
-        humidity, temperature = Adafruit_DHT.read_retry(DHT_SENSOR, DHT_PIN)
+        return dht_device.humidity, dht_device.temperature
+    except RuntimeError:
+        # Checksum or timing errors are common, just read again
+        return None, None
+
+
+# Each read waits on the sensor for a moment, so it runs on dht_executor's
+# thread; the pause between retries is spent on the event loop instead
+async def read_sensor():
+    loop = asyncio.get_running_loop()
+    for attempt in range(DHT_RETRIES):
+        if attempt:
+            await asyncio.sleep(DHT_MIN_INTERVAL)
+        humidity, temperature = await loop.run_in_executor(dht_executor, read_dht)
         if humidity is not None and temperature is not None:
-            logging.info("Temp: %s, Humidity: %s", temperature, humidity)
-            with open(FILENAME, "a") as f:
-                f.write(
-                    "{0},{1},{2:0.1f},{3:0.1f}%\r\n".format(
-                        time.strftime("%d/%m/%y"),
-                        time.strftime("%H:%M"),
-                        temperature,
-                        humidity,
-                    )
+            break
+    return humidity, temperature
+
+
+async def log_sensor_data():
+    try:
+        humidity, temperature = await read_sensor()
+        if humidity is not None and temperature is not None:
+            now = int(time.time())  # one timestamp for the CSV row and the point
+            logging.debug("Temp: %s, Humidity: %s", temperature, humidity)
+            csv_rows.append(
+                CSV_ROW.format(
+                    time.strftime("%d/%m/%y,%H:%M", time.localtime(now)),
+                    temperature,
+                    humidity,
                 )
-            write_to_influx(temperature, humidity)
+            )
+            if len(csv_rows) >= CSV_FLUSH_ROWS:
+                flush_csv()
+            if write_api is not None:
+                write_to_influx(temperature, humidity, now)
+        else:
+            flush_csv()  # the sensor is failing; get what we have onto disk
     except Exception as e:
         logging.error("Error occurred: %s", e)
+        flush_csv()
 
 
-def main():
-    initialize_file()
+async def sample_loop():
+    loop = asyncio.get_running_loop()
+    next_sample = loop.time()
     while True:
-        log_sensor_data()
-        time.sleep(15)
+        await log_sensor_data()
+
+        # Keep a fixed cadence on the monotonic clock, so the time spent
+        # reading doesn't stretch the interval; skip ahead if we fell behind
+        next_sample = max(next_sample + SAMPLE_INTERVAL, loop.time())
+        await asyncio.sleep(next_sample - loop.time())
+
+
+# Write out everything still buffered (CSV rows, pending InfluxDB batches)
+# and release the sensor
+def shutdown():
+    if csv_file is not None:
+        flush_csv()
+        try:
+            csv_file.close()
+        except OSError as e:
+            logging.error("Error closing %s: %s", FILENAME, e)
+    if write_api is not None:
+        write_api.close()  # flushes the pending batch
+        write_client.close()
+    if dht_device is not None:
+        # Cancelling main doesn't stop a read already running on the executor,
+        # so wait for it before releasing the GPIO
+        dht_executor.shutdown(wait=True)
+        dht_device.exit()
+
+
+# Ctrl-C and systemd's SIGTERM cancel the sampler so shutdown() still runs
+async def main():
+    loop = asyncio.get_running_loop()
+    main_task = asyncio.current_task()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, main_task.cancel)
+
+    try:
+        initialize_sensor()
+        initialize_file()
+        if USE_INFLUX:
+            initialize_influx()
+        await sample_loop()
+    except asyncio.CancelledError:
+        pass  # stopped by a signal
+    finally:
+        shutdown()
 
 
 if __name__ == "__main__":
-    main()
+    asyncio.run(main())